@@ -1,44 +1,84 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
-from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any, List, Union
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, Body
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Annotated, Awaitable, Optional, Dict, Any, List, Tuple, Union, Mapping
+import asyncio
+import hashlib
 import httpx
+import orjson
+import uvicorn
 import os
+import time
+from contextlib import asynccontextmanager
+from functools import partial
 from enum import Enum
+from types import MappingProxyType
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Provider endpoints for agent creation
+_VAPI_URL = "https://api.vapi.ai/assistants"
+_RETELL_URL = "https://api.retellai.com/agents"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Share one pooled client across requests so upstream connections are kept alive,
+    # with HTTP/2 so concurrent calls to the same host multiplex on one connection
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        timeout=30,
+        limits=httpx.Limits(max_keepalive_connections=50, max_connections=200, keepalive_expiry=30)
+    )
+    yield
+    await app.state.http.aclose()
+
 app = FastAPI(title="AI Agent Wrapper API", 
-              description="A unified API for creating agents on Vapi.ai and Retell")
+              description="A unified API for creating agents on Vapi.ai and Retell",
+              lifespan=lifespan,
+              default_response_class=ORJSONResponse)
 
 # Enum for provider selection
 class Provider(str, Enum):
     VAPI = "vapi"
     RETELL = "retell"
 
+# Generic LLM configuration, validated while the request is parsed
+class LLMConfig(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+    
+    provider: Annotated[str, Field(description="LLM provider")] = "openai"
+    model: Annotated[str, Field(description="LLM model to use")] = "gpt-4"
+    temperature: Annotated[float, Field(description="Sampling temperature")] = 0.7
+
+# Shared default config for requests that only set a model; frozen, so safe to reuse
+_DEFAULT_LLM_CONFIG = LLMConfig()
+
 # Common request model for creating an agent
 class CreateAgentRequest(BaseModel):
-    name: str = Field(..., description="Name of the agent")
-    description: Optional[str] = Field(None, description="Description of the agent")
-    provider: Provider = Field(..., description="AI provider to use (vapi or retell)")
-    voice_id: Optional[str] = Field(None, description="ID of the voice to be used")
-    language: Optional[str] = Field("en-US", description="Language code")
-    webhook_url: Optional[str] = Field(None, description="Webhook URL for notifications")
+    model_config = ConfigDict(extra="ignore")
+    
+    name: Annotated[str, Field(description="Name of the agent")]
+    description: Annotated[Optional[str], Field(description="Description of the agent")] = None
+    provider: Annotated[Provider, Field(description="AI provider to use (vapi or retell)")]
+    voice_id: Annotated[Optional[str], Field(description="ID of the voice to be used")] = None
+    language: Annotated[Optional[str], Field(description="Language code")] = "en-US"
+    webhook_url: Annotated[Optional[str], Field(description="Webhook URL for notifications")] = None
     
     # Optional provider-specific parameters
-    openai_config: Optional[Dict[str, Any]] = Field(None, description="OpenAI configuration (if applicable)")
-    anthropic_config: Optional[Dict[str, Any]] = Field(None, description="Anthropic configuration (if applicable)")
-    llm_config: Optional[Dict[str, Any]] = Field(None, description="Generic LLM configuration")
-    custom_instructions: Optional[str] = Field(None, description="Custom instructions for the agent")
+    openai_config: Annotated[Optional[Dict[str, Any]], Field(description="OpenAI configuration (if applicable)")] = None
+    anthropic_config: Annotated[Optional[Dict[str, Any]], Field(description="Anthropic configuration (if applicable)")] = None
+    llm_config: Annotated[Optional[LLMConfig], Field(description="Generic LLM configuration")] = None
+    custom_instructions: Annotated[Optional[str], Field(description="Custom instructions for the agent")] = None
     
     # Additional fields that might be specific to one provider but can be mapped
-    phone_number: Optional[str] = Field(None, description="Phone number (for Retell)")
-    initial_message: Optional[str] = Field(None, description="Initial message for the conversation")
-    forwarding_phone_number: Optional[str] = Field(None, description="Forwarding phone number (for Retell)")
-    first_message: Optional[str] = Field(None, description="First message for the agent to say")
-    avatar_url: Optional[str] = Field(None, description="URL of the avatar image")
-    model: Optional[str] = Field(None, description="LLM model to use")
+    phone_number: Annotated[Optional[str], Field(description="Phone number (for Retell)")] = None
+    initial_message: Annotated[Optional[str], Field(description="Initial message for the conversation")] = None
+    forwarding_phone_number: Annotated[Optional[str], Field(description="Forwarding phone number (for Retell)")] = None
+    first_message: Annotated[Optional[str], Field(description="First message for the agent to say")] = None
+    avatar_url: Annotated[Optional[str], Field(description="URL of the avatar image")] = None
+    model: Annotated[Optional[str], Field(description="LLM model to use")] = None
 
 class AgentResponse(BaseModel):
     id: str
@@ -47,149 +87,325 @@ class AgentResponse(BaseModel):
     raw_response: Dict[str, Any]
     # Additional standardized fields can be added here
 
-# Get API keys from environment variables
-def get_api_keys():
-    vapi_api_key = os.getenv("VAPI_API_KEY")
-    retell_api_key = os.getenv("RETELL_API_KEY")
-    
-    if not vapi_api_key or not retell_api_key:
+# Per-item result of a batch request; exactly one of agent or error is set
+class BatchAgentResult(BaseModel):
+    agent: Optional[AgentResponse] = None
+    status_code: int
+    error: Optional[str] = None
+
+# API keys, read from environment variables once at import
+_API_KEYS: Mapping[Provider, Optional[str]] = MappingProxyType({
+    Provider.VAPI: os.getenv("VAPI_API_KEY"),
+    Provider.RETELL: os.getenv("RETELL_API_KEY"),
+})
+_API_KEYS_CONFIGURED = all(_API_KEYS.values())
+
+# Outbound request headers, built once from the same keys; only used when
+# _API_KEYS_CONFIGURED is true, since require_api_keys guards every route
+VAPI_HEADERS = {
+    "Authorization": f"Bearer {_API_KEYS[Provider.VAPI]}",
+    "Content-Type": "application/json"
+}
+RETELL_HEADERS = {
+    "Authorization": f"Bearer {_API_KEYS[Provider.RETELL]}",
+    "Content-Type": "application/json"
+}
+
+# Reject requests when the API keys are missing (async, so no threadpool hop)
+async def require_api_keys() -> None:
+    if not _API_KEYS_CONFIGURED:
         raise HTTPException(status_code=500, detail="API keys not configured")
+
+# Short-lived cache of agent creations so client retries of an identical
+# request share one upstream POST. Entries hold the task making the call, so
+# a retry sent while the first call is still running waits on it; the entry
+# is never expired or evicted while in flight and is dropped if the call fails.
+_AGENT_CACHE_TTL = 60
+_AGENT_CACHE_SIZE = 1024
+_IN_FLIGHT = float("inf")
+_AGENT_CACHE: Dict[bytes, Tuple[float, "asyncio.Task[AgentResponse]"]] = {}
+
+def agent_cache_key(fields: Dict[str, Any]) -> bytes:
+    body = orjson.dumps(fields, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(body).digest()
+
+def _agent_call_done(key: bytes, task: "asyncio.Task[AgentResponse]") -> None:
+    # Always read the outcome so a failure nobody awaited isn't logged as unretrieved
+    failed = task.cancelled() or task.exception() is not None
+    entry = _AGENT_CACHE.get(key)
+    if entry is None or entry[1] is not task:
+        return
+    del _AGENT_CACHE[key]
+    if not failed:
+        # Re-insert at the end so completed entries stay ordered by expiry
+        _AGENT_CACHE[key] = (time.monotonic() + _AGENT_CACHE_TTL, task)
+
+def _prune_agent_cache(now: float) -> None:
+    """Drop expired entries, then the oldest completed one if the cache is still full"""
+    expired = []
+    for key, (expires_at, _) in _AGENT_CACHE.items():
+        if expires_at == _IN_FLIGHT:
+            continue  # in flight; never evicted
+        if expires_at > now:
+            break  # completed entries are in expiry order, so the rest are live
+        expired.append(key)
+    for key in expired:
+        del _AGENT_CACHE[key]
+    
+    if len(_AGENT_CACHE) >= _AGENT_CACHE_SIZE:
+        # If every entry is in flight the cache briefly grows past its size
+        # rather than dropping a call that identical requests may join
+        oldest_done = next((key for key, (expires_at, _) in _AGENT_CACHE.items()
+                            if expires_at != _IN_FLIGHT), None)
+        if oldest_done is not None:
+            del _AGENT_CACHE[oldest_done]
+
+async def cached_agent_call(request: CreateAgentRequest, client: httpx.AsyncClient) -> AgentResponse:
+    """Create an agent, sharing the upstream call with identical recent or in-flight requests"""
+    fields = dump_fields(request)
+    key = agent_cache_key(fields)
+    now = time.monotonic()
+    cached = _AGENT_CACHE.get(key)
+    if cached is not None:
+        expires_at, task = cached
+        if expires_at > now:
+            return await asyncio.shield(task)
+        del _AGENT_CACHE[key]
+    
+    _prune_agent_cache(now)
+    task = asyncio.ensure_future(agent_call(request, fields, client))
+    _AGENT_CACHE[key] = (_IN_FLIGHT, task)
+    task.add_done_callback(partial(_agent_call_done, key))
     
-    return {"vapi": vapi_api_key, "retell": retell_api_key}
+    # Shield the shared call so one client disconnecting doesn't cancel it for the others
+    return await asyncio.shield(task)
 
-@app.post("/create-agent", response_model=AgentResponse)
-async def create_agent(request: CreateAgentRequest, api_keys: Dict[str, str] = Depends(get_api_keys)):
+# Get the shared HTTP client created in the lifespan handler (async, so FastAPI
+# calls it directly instead of through the threadpool)
+async def get_http_client(request: Request) -> httpx.AsyncClient:
+    return request.app.state.http
+
+@app.post("/create-agent", response_model=AgentResponse, dependencies=[Depends(require_api_keys)])
+async def create_agent(request: CreateAgentRequest,
+                       client: httpx.AsyncClient = Depends(get_http_client)):
     """
     Create an agent using either Vapi.ai or Retell based on the provider parameter
     """
-    if request.provider == Provider.VAPI:
-        return await create_vapi_agent(request, api_keys["vapi"])
-    elif request.provider == Provider.RETELL:
-        return await create_retell_agent(request, api_keys["retell"])
-    else:
-        raise HTTPException(status_code=400, detail=f"Unsupported provider: {request.provider}")
-
-async def create_vapi_agent(request: CreateAgentRequest, api_key: str) -> AgentResponse:
-    """Create an agent using Vapi.ai API"""
-    # Map the unified request to Vapi.ai format
-    vapi_payload = {
-        "name": request.name,
-        "description": request.description,
-        "webhook_url": request.webhook_url,
-        "voice_id": request.voice_id,
-    }
+    return await cached_agent_call(request, client)
+
+# Upper bound on items per batch, kept well below the client's connection pool size
+_MAX_BATCH_SIZE = 50
+
+@app.post("/create-agents", response_model=List[BatchAgentResult], dependencies=[Depends(require_api_keys)])
+async def create_agents(requests: Annotated[List[CreateAgentRequest], Body(max_length=_MAX_BATCH_SIZE)],
+                        client: httpx.AsyncClient = Depends(get_http_client)):
+    """
+    Create several agents concurrently; a failure for one item does not abort the batch
+    """
+    results = await dispatch(requests, client, return_exceptions=True)
+    
+    batch = []
+    for result in results:
+        if isinstance(result, HTTPException):
+            batch.append(BatchAgentResult(status_code=result.status_code, error=str(result.detail)))
+        elif isinstance(result, BaseException):
+            batch.append(BatchAgentResult(status_code=500, error=str(result)))
+        else:
+            batch.append(BatchAgentResult(agent=result, status_code=200))
+    return batch
+
+# Decode a successful upstream body; 2xx responses can still be empty (204) or
+# not a JSON object, which is reported as a bad gateway rather than a crash
+def parse_upstream_json(response: httpx.Response, provider_name: str) -> Dict[str, Any]:
+    try:
+        body = orjson.loads(response.content)
+    except orjson.JSONDecodeError:
+        body = None
+    
+    if not isinstance(body, dict):
+        raise HTTPException(
+            status_code=502,
+            detail=f"{provider_name} API returned an invalid response: {response.text}"
+        )
+    return body
+
+# Payload builders are pure and cheap, so they run inline; if the mapping grows
+# CPU-heavy, call them through asyncio.to_thread to keep the event loop free
+def build_vapi_payload(request: CreateAgentRequest, fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Map the unified request to the Vapi.ai request body"""
+    # Map the unified request to Vapi.ai format, leaving out unset fields
+    vapi_payload = {k: v for k, v in (
+        ("name", fields["name"]),
+        ("description", fields.get("description")),
+        ("webhook_url", fields.get("webhook_url")),
+        ("voice_id", fields.get("voice_id")),
+    ) if v is not None}
     
     # Add conditional fields
-    if request.llm_config:
+    llm_cfg = request.llm_config
+    if llm_cfg is not None:
         vapi_payload["model"] = {
-            "provider": request.llm_config.get("provider", "openai"),
-            "model": request.llm_config.get("model", "gpt-4"),
-            "temperature": request.llm_config.get("temperature", 0.7),
-            "system_prompt": request.custom_instructions or "",
+            "provider": llm_cfg.provider,
+            "model": llm_cfg.model,
+            "temperature": llm_cfg.temperature,
+            "system_prompt": fields.get("custom_instructions") or "",
         }
     
     # Add first_message if provided
-    if request.first_message or request.initial_message:
-        vapi_payload["first_message"] = request.first_message or request.initial_message
+    if fields.get("first_message") or fields.get("initial_message"):
+        vapi_payload["first_message"] = fields.get("first_message") or fields.get("initial_message")
+    
+    return vapi_payload
+
+async def create_vapi_agent(request: CreateAgentRequest, fields: Dict[str, Any],
+                            client: httpx.AsyncClient) -> AgentResponse:
+    """Create an agent using Vapi.ai API"""
+    vapi_payload = build_vapi_payload(request, fields)
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.vapi.ai/assistants",
-                json=vapi_payload,
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                }
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Vapi.ai API error: {response.text}"
-                )
-            
-            vapi_response = response.json()
-            
-            # Map Vapi.ai response to standard format
-            return AgentResponse(
-                id=vapi_response.get("assistant_id", ""),
-                name=request.name,
-                provider=Provider.VAPI,
-                raw_response=vapi_response
+        response = await client.post(
+            _VAPI_URL,
+            content=orjson.dumps(vapi_payload),
+            headers=VAPI_HEADERS
+        )
+        
+        if not response.is_success:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Vapi.ai API error: {response.text}"
             )
+        
+        vapi_response = parse_upstream_json(response, "Vapi.ai")
+        
+        # Map Vapi.ai response to standard format
+        return AgentResponse(
+            id=vapi_response.get("assistant_id", ""),
+            name=request.name,
+            provider=Provider.VAPI,
+            raw_response=vapi_response
+        )
     except httpx.RequestError as e:
         raise HTTPException(status_code=500, detail=f"Error communicating with Vapi.ai: {str(e)}")
 
-async def create_retell_agent(request: CreateAgentRequest, api_key: str) -> AgentResponse:
-    """Create an agent using Retell API"""
-    # Map the unified request to Retell format
-    retell_payload = {
-        "name": request.name,
-        "description": request.description or "",
-        "voice_id": request.voice_id,
-        "webhook_url": request.webhook_url,
-        "language": request.language,
-    }
+def build_retell_payload(request: CreateAgentRequest, fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Map the unified request to the Retell request body"""
+    # Map the unified request to Retell format, leaving out unset fields
+    retell_payload = {k: v for k, v in (
+        ("name", fields["name"]),
+        ("description", fields.get("description") or ""),
+        ("voice_id", fields.get("voice_id")),
+        ("webhook_url", fields.get("webhook_url")),
+        ("language", fields.get("language")),
+    ) if v is not None}
     
     # Add phone number if provided
-    if request.phone_number:
-        retell_payload["phone_number"] = request.phone_number
+    if fields.get("phone_number"):
+        retell_payload["phone_number"] = fields.get("phone_number")
     
     # Add forwarding phone number if provided
-    if request.forwarding_phone_number:
-        retell_payload["forwarding_phone_number"] = request.forwarding_phone_number
+    if fields.get("forwarding_phone_number"):
+        retell_payload["forwarding_phone_number"] = fields.get("forwarding_phone_number")
     
     # Map LLM configuration
-    if request.llm_config or request.model:
-        llm_model = request.model or (request.llm_config or {}).get("model", "gpt-4")
-        llm_provider = (request.llm_config or {}).get("provider", "openai")
+    llm_cfg = request.llm_config
+    if llm_cfg is not None or fields.get("model"):
+        if llm_cfg is None:
+            llm_cfg = _DEFAULT_LLM_CONFIG
         
         retell_payload["llm"] = {
-            "provider": llm_provider,
-            "model": llm_model,
-            "temperature": (request.llm_config or {}).get("temperature", 0.7),
+            "provider": llm_cfg.provider,
+            "model": fields.get("model") or llm_cfg.model,
+            "temperature": llm_cfg.temperature,
         }
     
     # Add instructions if provided
-    if request.custom_instructions:
-        retell_payload["instructions"] = request.custom_instructions
+    if fields.get("custom_instructions"):
+        retell_payload["instructions"] = fields.get("custom_instructions")
     
     # Add avatar if provided
-    if request.avatar_url:
-        retell_payload["avatar_url"] = request.avatar_url
+    if fields.get("avatar_url"):
+        retell_payload["avatar_url"] = fields.get("avatar_url")
+    
+    return retell_payload
+
+async def create_retell_agent(request: CreateAgentRequest, fields: Dict[str, Any],
+                              client: httpx.AsyncClient) -> AgentResponse:
+    """Create an agent using Retell API"""
+    retell_payload = build_retell_payload(request, fields)
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.retellai.com/agents",
-                json=retell_payload,
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                }
-            )
-            
-            if response.status_code not in (200, 201):
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Retell API error: {response.text}"
-                )
-            
-            retell_response = response.json()
-            
-            # Map Retell response to standard format
-            return AgentResponse(
-                id=retell_response.get("id", ""),
-                name=request.name,
-                provider=Provider.RETELL,
-                raw_response=retell_response
+        response = await client.post(
+            _RETELL_URL,
+            content=orjson.dumps(retell_payload),
+            headers=RETELL_HEADERS
+        )
+        
+        if not response.is_success:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Retell API error: {response.text}"
             )
+        
+        retell_response = parse_upstream_json(response, "Retell")
+        
+        # Map Retell response to standard format
+        return AgentResponse(
+            id=retell_response.get("id", ""),
+            name=request.name,
+            provider=Provider.RETELL,
+            raw_response=retell_response
+        )
     except httpx.RequestError as e:
         raise HTTPException(status_code=500, detail=f"Error communicating with Retell: {str(e)}")
 
+# Map each provider to the function that creates its agent
+_DISPATCH = {
+    Provider.VAPI: create_vapi_agent,
+    Provider.RETELL: create_retell_agent,
+}
+
+async def unsupported_provider(request: CreateAgentRequest, fields: Dict[str, Any],
+                               client: httpx.AsyncClient) -> AgentResponse:
+    raise HTTPException(status_code=400, detail=f"Unsupported provider: {request.provider}")
+
+def dump_fields(request: CreateAgentRequest) -> Dict[str, Any]:
+    """Dump the request once; the cache key and payload builders all read this dict"""
+    return request.model_dump(exclude_none=True)
+
+def agent_call(request: CreateAgentRequest, fields: Dict[str, Any],
+               client: httpx.AsyncClient) -> Awaitable[AgentResponse]:
+    """Build the (not yet awaited) provider call for a request"""
+    handler = _DISPATCH.get(request.provider, unsupported_provider)
+    return handler(request, fields, client)
+
+async def dispatch(requests: List[CreateAgentRequest], client: httpx.AsyncClient,
+                   return_exceptions: bool = False) -> List[Any]:
+    """Run the provider calls for several requests concurrently, through the retry cache"""
+    return await asyncio.gather(
+        *[cached_agent_call(r, client) for r in requests],
+        return_exceptions=return_exceptions
+    )
+
+# The root metadata never changes, so encode it and its ETag once at import
+_ROOT_BODY = orjson.dumps({"message": "Welcome to the AI Agent Wrapper API", 
+                           "docs": "/docs",
+                           "providers": ["vapi", "retell"]})
+_ROOT_ETAG = f'"{hashlib.md5(_ROOT_BODY, usedforsecurity=False).hexdigest()}"'
+_ROOT_HEADERS = {"ETag": _ROOT_ETAG, "Cache-Control": "public, max-age=3600"}
+
+# If-None-Match may hold a list of tags, weak (W/) tags, or "*"; weak comparison applies
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
 @app.get("/")
-async def root():
-    return {"message": "Welcome to the AI Agent Wrapper API", 
-            "docs": "/docs",
-            "providers": ["vapi", "retell"]}
\ No newline at end of file
+async def root(request: Request):
+    if etag_matches(request.headers.get("if-none-match"), _ROOT_ETAG):
+        return Response(status_code=304, headers=_ROOT_HEADERS)
+    return Response(content=_ROOT_BODY, media_type="application/json", headers=_ROOT_HEADERS)
+
+if __name__ == "__main__":
+    uvicorn.run("main:app", host="0.0.0.0", port=8000,
+                loop="uvloop", http="httptools", workers=os.cpu_count())
\ No newline at end of file
@@ -1,4 +1,5 @@
-import requests
+import asyncio
+import httpx
 import json
 import os
 from dotenv import load_dotenv
@@ -7,7 +8,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Test creating a Vapi agent
-def test_create_vapi_agent():
+async def run_vapi_check(client: httpx.AsyncClient):
     url = "http://localhost:8000/create-agent"
     
     payload = {
@@ -25,15 +26,16 @@ def test_create_vapi_agent():
         "initial_message": "Hello! I'm your virtual assistant. How can I help you today?"
     }
     
-    response = requests.post(url, json=payload)
+    response = await client.post(url, json=payload)
     
-    print(f"Status Code: {response.status_code}")
-    print(f"Response: {json.dumps(response.json(), indent=2)}")
+    print("\n[Vapi] Agent creation result:")
+    print(f"[Vapi] Status Code: {response.status_code}")
+    print(f"[Vapi] Response: {json.dumps(response.json(), indent=2)}")
     
     return response.json()
 
 # Test creating a Retell agent
-def test_create_retell_agent():
+async def run_retell_check(client: httpx.AsyncClient):
     url = "http://localhost:8000/create-agent"
     
     payload = {
@@ -54,16 +56,28 @@ def test_create_retell_agent():
         "avatar_url": "https://example.com/avatar.png"  # Optional for Retell
     }
     
-    response = requests.post(url, json=payload)
+    response = await client.post(url, json=payload)
     
-    print(f"Status Code: {response.status_code}")
-    print(f"Response: {json.dumps(response.json(), indent=2)}")
+    print("\n[Retell] Agent creation result:")
+    print(f"[Retell] Status Code: {response.status_code}")
+    print(f"[Retell] Response: {json.dumps(response.json(), indent=2)}")
     
     return response.json()
 
-if __name__ == "__main__":
-    print("Testing Vapi agent creation...")
-    test_create_vapi_agent()
+# Run both checks concurrently against the running server
+async def main():
+    print("Testing Vapi and Retell agent creation...")
+    async with httpx.AsyncClient(timeout=30) as client:
+        results = await asyncio.gather(
+            run_vapi_check(client),
+            run_retell_check(client),
+            return_exceptions=True
+        )
     
-    print("\nTesting Retell agent creation...")
-    test_create_retell_agent()
\ No newline at end of file
+    # Report a failed check under its provider instead of letting it cancel the other
+    for label, result in zip(("Vapi", "Retell"), results):
+        if isinstance(result, BaseException):
+            print(f"\n[{label}] Error: {result!r}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file